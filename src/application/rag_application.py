@@ -2,13 +2,20 @@
 Módulo principal da aplicação RAG.
 """
 import os
+import json
+import hashlib
+from typing import Dict, List, Optional, Set
 
 from langchain.chains import create_retrieval_chain
 
-from src.readers.document_reader import DocumentReader
+from src.readers.document_reader import DocumentReader, EXTRACTION_VERSION
 from src.models.embedding_model import EmbeddingModel
 from src.models.language_model import LanguageModel
 from src.storage.vector_store import VectorStore
+from src.storage.query_cache import QueryCache
+
+# Arquivo, na pasta do índice em cache, com os documentos já indexados
+INDEXED_FILES_NAME = "files.json"
 
 
 class RAGApplication:
@@ -23,7 +30,10 @@ class RAGApplication:
             embedding_provider: str = "local", 
             embedding_model_name: str = None,
             embedding_kwargs: dict = None,
-            retriever_config: dict = None
+            retriever_config: dict = None,
+            vector_store_config: dict = None,
+            reader_config: dict = None,
+            cache_dir: str = ".cache"
         ):
         """
         Inicializa a aplicação RAG.
@@ -41,13 +51,38 @@ class RAGApplication:
                 - fetch_k: Número inicial de documentos para MMR
                 - lambda_mult: Balanço entre relevância e diversidade para MMR (0.0-1.0)
                 - filter: Filtros de metadados para a busca
+                - ef_search: Candidatos avaliados por consulta nos índices HNSW (latência x recall)
+            vector_store_config: Configuração do armazenamento de vetores:
+                - splitter: "recursive" ou "tokens"
+                - chunk_size: Tamanho de cada chunk (caracteres ou tokens, conforme o splitter)
+                - chunk_overlap: Sobreposição entre chunks
+                - index_type: "auto", "flat", "sq8", "hnsw", "hnsw_sq" ou "ivfpq"
+                - sq_type: Quantização do "hnsw_sq" ("fp16" ou "8bit")
+                - ivfpq_params: Parâmetros do IVFPQ ({"nlist", "m", "nbits", "nprobe"})
+                - use_gpu: Se True, faz as buscas com o índice na GPU
+            reader_config: Configuração do leitor de documentos:
+                - strategy: "auto", "fast" ou "hi_res"
+                - pages_per_batch: Páginas enviadas por vez ao OCR
+                - max_workers: PDFs processados em paralelo
+                - chunking_strategy: "by_title" para já dividir os documentos durante a leitura
+            cache_dir: Pasta onde o índice FAISS e o conteúdo extraído dos PDFs são salvos entre execuções.
         """
         self.api_key = api_key
         self.documents_folder = documents_folder
+        self.cache_dir = cache_dir
         self.retriever_config = retriever_config or {"k": 5}
+        self.vector_store_config = vector_store_config or {}
+        self.reader_config = reader_config or {}
         
         # Inicializa os componentes
-        self.document_reader = DocumentReader(documents_folder)
+        self.document_reader = DocumentReader(
+            documents_folder,
+            pages_per_batch=self.reader_config.get("pages_per_batch", 10),
+            strategy=self.reader_config.get("strategy", "auto"),
+            max_workers=self.reader_config.get("max_workers"),
+            cache_dir=os.path.join(cache_dir, "documents"),
+            chunking_strategy=self.reader_config.get("chunking_strategy")
+        )
         
         # Modelo de embeddings com base no provedor especificado
         self.embedding_model = EmbeddingModel(
@@ -58,7 +93,18 @@ class RAGApplication:
         )
         
         self.language_model = LanguageModel(api_key)
-        self.vector_store = VectorStore(self.embedding_model)
+        self.vector_store = VectorStore(
+            self.embedding_model,
+            chunk_size=self.vector_store_config.get("chunk_size"),
+            chunk_overlap=self.vector_store_config.get("chunk_overlap"),
+            splitter=self.vector_store_config.get("splitter", "recursive"),
+            index_type=self.vector_store_config.get("index_type", "auto"),
+            sq_type=self.vector_store_config.get("sq_type", "fp16"),
+            use_gpu=self.vector_store_config.get("use_gpu", False)
+        )
+        
+        # Cache de respostas para consultas repetidas ou parecidas
+        self.query_cache = QueryCache(self.embedding_model)
         
         # Cadeia RAG
         self.retrieval_chain = None
@@ -69,17 +115,54 @@ class RAGApplication:
         """
         print("Configurando a aplicação de RAG com Análise de Layout...")
         
-        # 1. Processa os documentos
-        documents = self.document_reader.process_all_documents()
+        index_path = self.get_index_cache_path()
+        files = self.get_document_files()
+        indexed_files = self.load_indexed_files(index_path)
         
-        if not documents:
-            raise ValueError("Não foi possível processar nenhum documento.")
+        # O índice em cache pode ser reaproveitado se nenhum arquivo indexado mudou
+        # ou foi removido; arquivos novos são apenas adicionados a ele
+        reusable = indexed_files is not None and all(
+            files.get(path) == stat for path, stat in indexed_files.items()
+        )
         
-        print(documents)
+        if reusable:
+            # 1-2. Documentos inalterados: carrega a base de vetores do cache
+            print(f"Carregando a base de vetores do cache em '{index_path}'...")
+            self.vector_store.load(index_path)
+            
+            new_files = [path for path in files if path not in indexed_files]
+            if new_files:
+                print(f"{len(new_files)} arquivo(s) novo(s) na pasta de documentos.")
+                self.add_documents(new_files)
+        else:
+            # 1. Processa os documentos
+            pdf_files = self.document_reader.get_pdf_files()
+            documents_per_file = self.document_reader.process_documents(pdf_files)
+            documents = [doc for docs in documents_per_file.values() for doc in docs]
+            
+            if not documents:
+                raise ValueError("Não foi possível processar nenhum documento.")
+            
+            print(documents)
+            
+            # 2. Cria o armazenamento de vetores e salva no cache
+            print("Criando embeddings e a base de vetores...")
+            self.vector_store.create_vector_store(
+                documents, 
+                **self.vector_store_config.get("ivfpq_params", {})
+            )
+            self.vector_store.save(index_path)
+            
+            # PDFs que falharam ficam fora da lista, para serem tentados de novo
+            failed_files = self.get_failed_files(pdf_files, documents_per_file)
+            self.save_indexed_files(
+                index_path, 
+                {path: stat for path, stat in files.items() if path not in failed_files}
+            )
         
-        # 2. Cria o armazenamento de vetores
-        print("Criando embeddings e a base de vetores...")
-        self.vector_store.create_vector_store(documents)
+        # O índice é salvo a partir da CPU; só depois vai para a GPU
+        if self.vector_store.use_gpu:
+            self.vector_store.move_index_to_gpu()
         
         # 3. Cria o retriever com as configurações especificadas
         retriever = self.vector_store.get_retriever(
@@ -88,7 +171,8 @@ class RAGApplication:
             score_threshold=self.retriever_config.get("score_threshold"),
             fetch_k=self.retriever_config.get("fetch_k"),
             lambda_mult=self.retriever_config.get("lambda_mult", 0.5),
-            filter=self.retriever_config.get("filter")
+            filter=self.retriever_config.get("filter"),
+            ef_search=self.retriever_config.get("ef_search")
         )
         
         # 4. Cria a cadeia de documentos
@@ -99,6 +183,136 @@ class RAGApplication:
         
         print("\n✅ Aplicação pronta!")
         
+    def add_documents(self, files: List[str]):
+        """
+        Adiciona arquivos da pasta de documentos ao índice carregado, sem reconstruí-lo,
+        e salva o índice atualizado no cache.
+        
+        Args:
+            files: Caminhos dos arquivos, relativos à pasta de documentos.
+        """
+        index_path = self.get_index_cache_path()
+        
+        # Mesmo critério da leitura completa (DocumentReader.get_pdf_files)
+        pdf_files = [
+            path for path in self.document_reader.get_pdf_files()
+            if os.path.relpath(path, self.documents_folder) in files
+        ]
+        
+        documents_per_file = self.document_reader.process_documents(pdf_files) if pdf_files else {}
+        documents = [doc for docs in documents_per_file.values() for doc in docs]
+        if documents:
+            print("Criando embeddings dos novos documentos...")
+            self.vector_store.add_documents(documents)
+            self.vector_store.save(index_path)
+        
+        # Registra os arquivos processados, mesmo sem conteúdo, para não processá-los
+        # de novo; os PDFs que falharam serão tentados na próxima execução
+        failed_files = self.get_failed_files(pdf_files, documents_per_file)
+        indexed_files = self.load_indexed_files(index_path) or {}
+        current_files = self.get_document_files()
+        indexed_files.update({
+            path: current_files[path] for path in files 
+            if path in current_files and path not in failed_files
+        })
+        self.save_indexed_files(index_path, indexed_files)
+        
+        # Respostas anteriores não consideram os novos documentos
+        self.query_cache.clear()
+
+    def get_failed_files(self, pdf_files: List[str], documents_per_file: Dict[str, list]) -> Set[str]:
+        """
+        Identifica os PDFs cujo processamento falhou.
+        
+        Args:
+            pdf_files: PDFs enviados ao leitor.
+            documents_per_file: Resultado de DocumentReader.process_documents.
+            
+        Returns:
+            Caminhos, relativos à pasta de documentos, dos PDFs sem resultado.
+        """
+        return {
+            os.path.relpath(path, self.documents_folder) 
+            for path in pdf_files if path not in documents_per_file
+        }
+
+    def get_document_files(self) -> Dict[str, List[int]]:
+        """
+        Lista os arquivos da pasta de documentos com seu mtime e tamanho.
+        
+        Returns:
+            Dicionário caminho relativo -> [mtime em ns, tamanho em bytes].
+        """
+        files = {}
+        for root, _, names in os.walk(self.documents_folder):
+            for name in names:
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                files[os.path.relpath(path, self.documents_folder)] = [stat.st_mtime_ns, stat.st_size]
+                
+        return files
+
+    @staticmethod
+    def load_indexed_files(index_path: str) -> Optional[Dict[str, List[int]]]:
+        """
+        Lê a lista de arquivos já incluídos no índice em cache.
+        
+        Args:
+            index_path: Pasta do índice FAISS em cache.
+            
+        Returns:
+            Arquivos indexados (ver get_document_files), ou None se não houver um
+            índice em cache completo.
+        """
+        manifest_path = os.path.join(index_path, INDEXED_FILES_NAME)
+        if not VectorStore.exists(index_path) or not os.path.exists(manifest_path):
+            return None
+        
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    @staticmethod
+    def save_indexed_files(index_path: str, files: Dict[str, List[int]]):
+        """
+        Salva a lista de arquivos incluídos no índice em cache.
+        
+        Args:
+            index_path: Pasta do índice FAISS em cache.
+            files: Arquivos indexados (ver get_document_files).
+        """
+        with open(os.path.join(index_path, INDEXED_FILES_NAME), "w", encoding="utf-8") as f:
+            json.dump(files, f, sort_keys=True)
+        
+    def get_index_cache_path(self) -> str:
+        """
+        Calcula o caminho do índice em cache para a configuração atual.
+        
+        A chave é um SHA256 apenas sobre o que muda o conteúdo do índice: modelo de
+        embeddings e seus parâmetros de saída, divisão em chunks, tipo e parâmetros do
+        índice e estratégias de leitura. Ajustes de execução (max_workers,
+        pages_per_batch, batch_size, device...) não invalidam o cache. Os arquivos já
+        indexados ficam registrados junto do índice (INDEXED_FILES_NAME): arquivos
+        novos são adicionados ao índice existente, e arquivos alterados ou removidos
+        forçam a reconstrução.
+        
+        Returns:
+            Caminho da pasta do índice FAISS em cache.
+        """
+        key_data = {
+            "embedding": self.embedding_model.get_cache_signature(),
+            "vector_store": self.vector_store.get_cache_signature(
+                self.vector_store_config.get("ivfpq_params")
+            ),
+            "reader": {
+                "strategy": self.document_reader.strategy,
+                "chunking_strategy": self.document_reader.chunking_strategy,
+                "extraction_version": EXTRACTION_VERSION,
+            },
+        }
+        key = hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        
+        return os.path.join(self.cache_dir, "faiss", key)
+        
     def process_query(self, query: str) -> str:
         """
         Processa uma consulta e retorna a resposta.
@@ -111,10 +325,20 @@ class RAGApplication:
         """
         if not self.retrieval_chain:
             raise ValueError("A aplicação ainda não foi inicializada. Chame initialize primeiro.")
+        
+        # Respostas em cache só valem para a configuração atual do retriever
+        self.query_cache.set_config(self.retriever_config)
+        
+        answer, query_vector = self.query_cache.lookup(query)
+        if answer is not None:
+            print("Resposta encontrada no cache.")
+            return answer
             
         print("Buscando resposta...")
         response = self.retrieval_chain.invoke({"input": query})
         
+        self.query_cache.store(query, response["answer"], query_vector)
+        
         return response["answer"]
         
     def run_interactive(self):
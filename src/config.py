@@ -0,0 +1,76 @@
+"""
+Módulo para carregar a configuração da aplicação a partir do .env.
+"""
+import os
+import json
+import functools
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+
+
+@dataclass(frozen=True)
+class Config:
+    """
+    Configuração da aplicação lida das variáveis de ambiente.
+    """
+    api_key: Optional[str]
+    embedding_provider: str
+    embedding_model_name: Optional[str]
+    embedding_kwargs: Optional[dict]
+    retriever_config: Optional[dict]
+    vector_store_config: Optional[dict]
+    reader_config: Optional[dict]
+
+
+def _load_json_env(name: str, description: str) -> Optional[dict]:
+    """
+    Lê uma variável de ambiente em formato JSON, retornando None se ausente ou inválida.
+    
+    Args:
+        name: Nome da variável de ambiente.
+        description: Descrição usada na mensagem de carregamento.
+    """
+    value = os.getenv(name)
+    if not value:
+        return None
+    
+    try:
+        parsed = json.loads(value)
+        print(f"Carregada configuração de {description}: {parsed}")
+        return parsed
+    except json.JSONDecodeError:
+        print(f"AVISO: {name} não é um JSON válido, ignorando.")
+        return None
+
+
+@functools.lru_cache(maxsize=1)
+def get_config() -> Config:
+    """
+    Carrega o .env e interpreta a configuração uma única vez por processo.
+    
+    Returns:
+        Configuração da aplicação.
+    """
+    load_dotenv()
+    google_api_key = os.getenv("GOOGLE_API_KEY")
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    
+    # Configuração do modelo de embedding
+    embedding_provider = os.getenv("EMBEDDING_PROVIDER", "local")
+    
+    # Decide qual API key usar
+    api_key = google_api_key
+    if embedding_provider == "openai" and openai_api_key:
+        api_key = openai_api_key
+    
+    return Config(
+        api_key=api_key,
+        embedding_provider=embedding_provider,
+        embedding_model_name=os.getenv("EMBEDDING_MODEL"),
+        embedding_kwargs=_load_json_env("EMBEDDING_KWARGS", "parâmetros avançados para embedding"),
+        retriever_config=_load_json_env("RETRIEVER_CONFIG", "configuração do retriever"),
+        vector_store_config=_load_json_env("VECTOR_STORE_CONFIG", "configuração do armazenamento de vetores"),
+        reader_config=_load_json_env("READER_CONFIG", "configuração do leitor de documentos")
+    )
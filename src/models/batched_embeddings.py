@@ -0,0 +1,180 @@
+"""
+Módulo com um adaptador que agrupa as chamadas de embeddings em lotes.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def _get_retry_after(error: Exception) -> Optional[float]:
+    """
+    Verifica se o erro é de limite de requisições (HTTP 429).
+    
+    Percorre também a cadeia de causas (__cause__/__context__), já que alguns
+    provedores encapsulam o erro original: o GoogleGenerativeAIError, por exemplo,
+    é lançado "from" o ResourceExhausted da API.
+    
+    Returns:
+        Tempo de espera em segundos indicado pelo cabeçalho Retry-After (0.0 se ausente),
+        ou None se o erro não for de limite de requisições.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        
+        response = getattr(error, "response", None)
+        status = getattr(error, "status_code", None) or getattr(error, "code", None) or getattr(response, "status_code", None)
+        if status == 429:
+            headers = getattr(response, "headers", None) or {}
+            try:
+                return float(headers.get("retry-after"))
+            except (TypeError, ValueError):
+                return 0.0
+            
+        error = error.__cause__ or error.__context__
+        
+    return None
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Adaptador que divide os textos em lotes antes de chamar o modelo de embeddings.
+    
+    Reduz o número de requisições de len(textos) para ceil(len(textos) / batch_size),
+    mantendo a interface padrão de Embeddings usada pelo FAISS. Os lotes são enviados
+    em paralelo por até max_workers threads, já que as chamadas são limitadas por I/O.
+    """
+
+    def __init__(self, 
+                 embeddings: Embeddings, 
+                 batch_size: int = 96, 
+                 max_workers: int = 4,
+                 max_retries: int = 5,
+                 show_progress: bool = True,
+                 normalize_queries: bool = True):
+        """
+        Inicializa o adaptador.
+        
+        Args:
+            embeddings: Modelo de embeddings a ser encapsulado.
+            batch_size: Quantidade máxima de textos enviada em cada chamada.
+            max_workers: Quantidade máxima de lotes em processamento simultâneo.
+            max_retries: Número de novas tentativas de um lote após erro HTTP 429.
+            show_progress: Se True, informa o progresso a cada lote concluído.
+            normalize_queries: Se True, embed_query devolve o vetor com norma L2 unitária,
+                para que o produto interno do índice equivalha à similaridade de cosseno.
+                Os vetores dos documentos são normalizados pelo VectorStore ao criar o índice.
+        """
+        if batch_size < 1:
+            raise ValueError("batch_size deve ser maior que zero")
+        if max_workers < 1:
+            raise ValueError("max_workers deve ser maior que zero")
+            
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.show_progress = show_progress
+        self.normalize_queries = normalize_queries
+        self.last_query = None
+
+    def _embed_one_batch(self, batch_texts: List[str], batch_idx: int) -> List[List[float]]:
+        """
+        Gera os embeddings de um lote, respeitando o Retry-After em respostas HTTP 429.
+        
+        Args:
+            batch_texts: Textos do lote.
+            batch_idx: Índice do lote, usado nas mensagens de aviso.
+            
+        Returns:
+            Vetores do lote, na mesma ordem dos textos.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.embeddings.embed_documents(batch_texts)
+            except Exception as e:
+                retry_after = _get_retry_after(e)
+                if retry_after is None or attempt == self.max_retries:
+                    raise
+                
+                # Backoff exponencial com jitter para que os lotes não tentem todos ao mesmo tempo
+                delay = max(retry_after, 2 ** attempt)
+                delay += random.uniform(0, delay / 2)
+                print(f"  Limite de requisições atingido no lote {batch_idx}. Nova tentativa em {delay:.1f}s...")
+                time.sleep(delay)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera os embeddings dos documentos, um lote por chamada ao modelo.
+        
+        Args:
+            texts: Textos a serem convertidos em vetores.
+            
+        Returns:
+            Lista de vetores, na mesma ordem dos textos.
+        """
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        show_progress = self.show_progress and len(batches) > 1
+        
+        # Cada resultado é guardado na posição do seu lote para preservar a ordem
+        results = [None] * len(batches)
+        done = 0
+        
+        if self.max_workers == 1 or len(batches) <= 1:
+            for idx, batch in enumerate(batches):
+                results[idx] = self._embed_one_batch(batch, idx)
+                done += len(batch)
+                if show_progress:
+                    print(f"  Embeddings gerados: {done}/{len(texts)}")
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {
+                    executor.submit(self._embed_one_batch, batch, idx): idx
+                    for idx, batch in enumerate(batches)
+                }
+                try:
+                    for future in as_completed(futures):
+                        idx = futures[future]
+                        results[idx] = future.result()
+                        done += len(batches[idx])
+                        if show_progress:
+                            print(f"  Embeddings gerados: {done}/{len(texts)}")
+                except BaseException:
+                    # Não envia os lotes ainda na fila depois de um erro definitivo
+                    executor.shutdown(cancel_futures=True)
+                    raise
+        
+        vectors = []
+        for batch_vectors in results:
+            vectors.extend(batch_vectors)
+            
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Gera o embedding de uma consulta.
+        
+        A última consulta fica memorizada: o cache de respostas e o retriever embedam
+        a mesma pergunta em sequência, e a segunda chamada não vai ao provedor.
+        
+        Args:
+            text: Texto da consulta.
+            
+        Returns:
+            Vetor da consulta.
+        """
+        last_query = self.last_query
+        if last_query is not None and last_query[0] == text:
+            return list(last_query[1])
+        
+        vector = self.embeddings.embed_query(text)
+        if self.normalize_queries:
+            vector = np.asarray(vector, dtype=np.float32)
+            vector = (vector / max(float(np.linalg.norm(vector)), 1e-12)).tolist()
+        self.last_query = (text, vector)
+        
+        return list(vector)
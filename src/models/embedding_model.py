@@ -1,6 +1,7 @@
 """
 Módulo para gerenciar modelos de embeddings.
 """
+import copy
 import importlib
 import warnings
 from typing import Optional, Dict, Any, Union, Literal
@@ -8,8 +9,28 @@ from typing import Optional, Dict, Any, Union, Literal
 # Importações principais
 from langchain_core.embeddings import Embeddings
 
-# Importação garantida para Google (já está no projeto)
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from src.models.batched_embeddings import BatchedEmbeddings
+
+# Tamanho padrão dos lotes de embeddings por provedor (limites das APIs)
+DEFAULT_BATCH_SIZES = {
+    "google": 96,
+    "openai": 512,
+    "huggingface": 256,
+    "local": 256,
+}
+
+# Lotes simultâneos por provedor: APIs remotas se beneficiam de paralelismo,
+# modelos locais já ocupam a CPU/GPU com um único lote
+DEFAULT_MAX_WORKERS = {
+    "google": 4,
+    "openai": 4,
+    "huggingface": 1,
+    "local": 1,
+}
+
+# Parâmetros (em model_kwargs ou encode_kwargs) que mudam os vetores gerados;
+# os demais (device, batch_size, timeouts, progresso) só afetam a execução
+EMBEDDING_CONTENT_KWARGS = ("backend", "task_type", "title", "dimensions", "prompt", "prompt_name")
 
 # Importações condicionais para outros provedores
 def _import_optional_module(module_name: str):
@@ -20,6 +41,16 @@ def _import_optional_module(module_name: str):
         return None
 
 
+def resolve_huggingface_model_id(model_name: str) -> str:
+    """
+    Converte nomes curtos do sentence-transformers (ex.: "all-MiniLM-L6-v2") no id
+    completo do Hugging Face Hub, como o próprio sentence-transformers faz.
+    """
+    if "/" not in model_name:
+        return f"sentence-transformers/{model_name}"
+    return model_name
+
+
 class EmbeddingModel:
     """
     Classe responsável por gerenciar modelos de embeddings com suporte a diferentes provedores.
@@ -29,7 +60,9 @@ class EmbeddingModel:
                  api_key: Optional[str] = None, 
                  provider: Literal["google", "openai", "huggingface", "local"] = "local",
                  model_name: Optional[str] = None,
-                 model_kwargs: Optional[Dict[str, Any]] = None):
+                 model_kwargs: Optional[Dict[str, Any]] = None,
+                 batch_size: Optional[int] = None,
+                 max_workers: Optional[int] = None):
         """
         Inicializa o modelo de embeddings.
         
@@ -44,7 +77,14 @@ class EmbeddingModel:
                 - Google: {"task_type": "retrieval_query" ou "retrieval_document", "title": "título opcional", "cache": True}
                 - OpenAI: {"chunk_size": 1000, "timeout": 60, "show_progress_bar": True, "retry_on_rate_limit": True}
                 - HuggingFace/Local: {"encode_kwargs": {"batch_size": 32, "show_progress_bar": True, "normalize_embeddings": True}, 
-                                     "model_kwargs": {"device": "cuda" ou "cpu"}}
+                                     "model_kwargs": {"device": "cuda" ou "cpu", "torch_dtype": "float16" ou "float32"}}
+                  Por padrão usa "cuda" com fp16 e batch_size 256 quando há GPU, e normaliza os embeddings.
+                  Com {"backend": "onnx-int8"}, usa o modelo exportado para ONNX e quantizado em int8 
+                  (requer optimum[onnxruntime]), mais rápido na CPU.
+            batch_size: Quantidade de textos enviada por chamada ao gerar embeddings de documentos.
+                Se não informado, usa o padrão do provedor (96 para Google, 512 para OpenAI).
+            max_workers: Quantidade de lotes enviados simultaneamente ao provedor.
+                Se não informado, usa 4 para APIs remotas e 1 para modelos locais.
         """
         self.api_key = api_key
         self.provider = provider
@@ -63,6 +103,8 @@ class EmbeddingModel:
             self.model_name = model_name
         
         self.model_kwargs = model_kwargs or {}
+        self.batch_size = batch_size or DEFAULT_BATCH_SIZES.get(provider, 96)
+        self.max_workers = max_workers or DEFAULT_MAX_WORKERS.get(provider, 1)
         self.initialize_model()
 
     def initialize_model(self):
@@ -73,7 +115,15 @@ class EmbeddingModel:
             if not self.api_key:
                 raise ValueError("API key é necessária para o provedor Google")
             
-            self.embeddings = GoogleGenerativeAIEmbeddings(
+            # Importação feita apenas quando o provedor Google é selecionado
+            google_module = _import_optional_module("langchain_google_genai")
+            if google_module is None:
+                raise ImportError(
+                    "O pacote 'langchain-google-genai' não está instalado. "
+                    "Instale com: pip install langchain-google-genai"
+                )
+            
+            self.embeddings = google_module.GoogleGenerativeAIEmbeddings(
                 model=self.model_name, 
                 google_api_key=self.api_key,
                 **self.model_kwargs
@@ -97,6 +147,17 @@ class EmbeddingModel:
                 **self.model_kwargs
             )
         
+        elif self.provider in ["huggingface", "local"] and self.model_kwargs.get("backend") == "onnx-int8":
+            # Modelo exportado para ONNX e quantizado em int8, mais rápido na CPU
+            from src.models.onnx_embeddings import ONNXInt8Embeddings
+            
+            encode_kwargs = self.model_kwargs.get("encode_kwargs", {})
+            self.embeddings = ONNXInt8Embeddings(
+                model_name=self.model_name,
+                batch_size=encode_kwargs.get("batch_size", 32),
+                normalize_embeddings=encode_kwargs.get("normalize_embeddings", True)
+            )
+        
         elif self.provider in ["huggingface", "local"]:
             # Importação condicional para HuggingFace usando o pacote recomendado
             hf_embeddings = None
@@ -136,7 +197,9 @@ class EmbeddingModel:
             
             # Para modelos locais, não é necessário API key
             # Corrigindo o tratamento do parâmetro device, que deve estar dentro de model_kwargs
-            model_kwargs = self.model_kwargs.copy() if self.model_kwargs else {}
+            # Cópia profunda: os ajustes abaixo alteram dicionários aninhados, que podem
+            # ser compartilhados com a configuração em cache (get_config)
+            model_kwargs = copy.deepcopy(self.model_kwargs) if self.model_kwargs else {}
             
             # Se device foi passado diretamente ou dentro de encode_kwargs, movemos para model_kwargs
             if "device" in model_kwargs:
@@ -149,14 +212,44 @@ class EmbeddingModel:
                 device = model_kwargs["encode_kwargs"].pop("device")
                 model_kwargs["model_kwargs"] = model_kwargs.get("model_kwargs", {})
                 model_kwargs["model_kwargs"]["device"] = device
+            
+            # Por padrão usa a GPU quando disponível, com pesos em fp16 e lotes grandes.
+            # Na CPU, a alternativa mais rápida é o backend ONNX quantizado em int8.
+            torch = _import_optional_module("torch")
+            cuda_available = torch is not None and torch.cuda.is_available()
+            
+            model_kwargs["model_kwargs"] = dict(model_kwargs.get("model_kwargs", {}))
+            model_kwargs["model_kwargs"].setdefault("device", "cuda" if cuda_available else "cpu")
+            on_gpu = str(model_kwargs["model_kwargs"]["device"]).startswith("cuda")
+            
+            # sentence-transformers < 3 não aceita torch_dtype; a conversão é feita após carregar
+            torch_dtype = model_kwargs["model_kwargs"].pop("torch_dtype", "float16" if on_gpu else None)
+            use_fp16 = on_gpu and str(torch_dtype).replace("torch.", "") in ("float16", "fp16")
+            
+            model_kwargs["encode_kwargs"] = dict(model_kwargs.get("encode_kwargs", {}))
+            model_kwargs["encode_kwargs"].setdefault("normalize_embeddings", True)
+            if on_gpu:
+                model_kwargs["encode_kwargs"].setdefault("batch_size", 256)
                 
             self.embeddings = hf_embeddings(
                 model_name=self.model_name,
                 **model_kwargs
             )
+            
+            if use_fp16:
+                # langchain_huggingface guarda o SentenceTransformer em _client; a versão da community, em client
+                client = getattr(self.embeddings, "_client", None) or getattr(self.embeddings, "client", None)
+                client.half()
         
         else:
             raise ValueError(f"Provedor não suportado: {self.provider}")
+        
+        # Agrupa as chamadas de embeddings de documentos em lotes enviados em paralelo
+        self.embeddings = BatchedEmbeddings(
+            self.embeddings, 
+            batch_size=self.batch_size, 
+            max_workers=self.max_workers
+        )
 
     def get_embeddings_model(self) -> Embeddings:
         """
@@ -168,4 +261,51 @@ class EmbeddingModel:
         if not self.embeddings:
             self.initialize_model()
             
-        return self.embeddings
\ No newline at end of file
+        return self.embeddings
+
+    def get_cache_signature(self) -> Dict[str, Any]:
+        """
+        Retorna os parâmetros do modelo que mudam os embeddings gerados, usados na
+        chave do índice em cache.
+        
+        Returns:
+            Provedor, nome do modelo, normalização e os parâmetros de EMBEDDING_CONTENT_KWARGS
+            informados.
+        """
+        encode_kwargs = self.model_kwargs.get("encode_kwargs", {})
+        signature = {
+            "provider": self.provider,
+            "model_name": self.model_name,
+            "normalize_embeddings": encode_kwargs.get("normalize_embeddings", True),
+        }
+        for key in EMBEDDING_CONTENT_KWARGS:
+            value = self.model_kwargs.get(key, encode_kwargs.get(key))
+            if value is not None:
+                signature[key] = value
+                
+        return signature
+
+    def get_max_seq_length(self) -> Optional[int]:
+        """
+        Retorna a quantidade máxima de tokens por texto do modelo local de embeddings.
+        
+        Textos mais longos são truncados pelo modelo ao gerar o embedding.
+        
+        Returns:
+            max_seq_length do SentenceTransformer (ou o limite do tokenizador no backend
+            ONNX), ou None para provedores remotos ou se o limite for desconhecido.
+        """
+        embeddings = self.get_embeddings_model()
+        # O modelo original fica dentro do BatchedEmbeddings
+        embeddings = getattr(embeddings, "embeddings", embeddings)
+        
+        client = getattr(embeddings, "_client", None) or getattr(embeddings, "client", None)
+        max_seq_length = getattr(client, "max_seq_length", None)
+        if max_seq_length is None:
+            tokenizer = getattr(embeddings, "tokenizer", None)
+            max_seq_length = getattr(tokenizer, "model_max_length", None)
+        
+        # Tokenizadores sem limite configurado informam um valor sentinela enorme
+        if not isinstance(max_seq_length, int) or max_seq_length > 1_000_000:
+            return None
+        return max_seq_length
@@ -5,13 +5,27 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain.chains.combine_documents import create_stuff_documents_chain
 
+# Instruções fixas, enviadas antes de qualquer conteúdo variável para que o
+# prefixo do prompt seja idêntico entre as consultas e possa ser reaproveitado
+# pelo cache implícito de prefixos do Gemini
+SYSTEM_PROMPT = """Você é um assistente especialista em análise de documentos. Responda à pergunta do usuário com base apenas no contexto fornecido.
+O contexto pode conter textos normais e tabelas em formato HTML. Analise ambos para formular sua resposta."""
+
+HUMAN_PROMPT = """Contexto:
+{context}
+
+Pergunta: {input}"""
+
 
 class LanguageModel:
     """
     Classe responsável por gerenciar o modelo de linguagem.
     """
 
-    def __init__(self, api_key: str, model_name: str = "gemini-2.0-flash", temperature: float = 0.1):
+    def __init__(self, 
+                 api_key: str, 
+                 model_name: str = "gemini-2.0-flash", 
+                 temperature: float = 0.1):
         """
         Inicializa o modelo de linguagem.
         
@@ -59,16 +73,13 @@ class LanguageModel:
             Cadeia para processar documentos.
         """
         if prompt_template is None:
-            prompt_template = """
-            Você é um assistente especialista em análise de documentos. Responda à pergunta do usuário com base apenas no contexto fornecido.
-            O contexto pode conter textos normais e tabelas em formato HTML. Analise ambos para formular sua resposta.
-
-            Contexto:
-            {context}
-
-            Pergunta: {input}
-            """
-            
-        prompt = ChatPromptTemplate.from_template(prompt_template)
+            # Instruções fixas primeiro e a pergunta por último, para maximizar o
+            # prefixo comum entre as consultas
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", SYSTEM_PROMPT),
+                ("human", HUMAN_PROMPT)
+            ])
+        else:
+            prompt = ChatPromptTemplate.from_template(prompt_template)
         
         return create_stuff_documents_chain(self.get_language_model(), prompt)
\ No newline at end of file
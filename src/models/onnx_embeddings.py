@@ -0,0 +1,101 @@
+"""
+Módulo com embeddings locais executados pelo ONNX Runtime com pesos quantizados em int8.
+"""
+import os
+import importlib
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.models.embedding_model import resolve_huggingface_model_id
+
+
+class ONNXInt8Embeddings(Embeddings):
+    """
+    Embeddings de um modelo sentence-transformers exportado para ONNX e quantizado
+    dinamicamente em int8 (AVX2), para inferência mais rápida na CPU.
+    
+    O modelo é exportado e quantizado apenas na primeira execução; as seguintes
+    carregam o arquivo quantizado salvo em cache_dir.
+    """
+
+    def __init__(self, 
+                 model_name: str, 
+                 cache_dir: str = ".cache/onnx", 
+                 batch_size: int = 32, 
+                 normalize_embeddings: bool = True):
+        """
+        Inicializa o modelo.
+        
+        Args:
+            model_name: Nome do modelo no Hugging Face Hub.
+            cache_dir: Pasta onde o modelo quantizado é salvo.
+            batch_size: Quantidade de textos por inferência.
+            normalize_embeddings: Se True, normaliza os vetores para norma 1.
+        """
+        try:
+            ort = importlib.import_module("optimum.onnxruntime")
+            ort_configuration = importlib.import_module("optimum.onnxruntime.configuration")
+            transformers = importlib.import_module("transformers")
+        except ImportError:
+            raise ImportError(
+                "O backend onnx-int8 requer o pacote 'optimum[onnxruntime]'. "
+                "Instale com: pip install optimum[onnxruntime]"
+            )
+        
+        self.batch_size = batch_size
+        self.normalize_embeddings = normalize_embeddings
+        
+        model_id = resolve_huggingface_model_id(model_name)
+        quantized_dir = os.path.join(cache_dir, model_id.replace("/", "__") + "-int8")
+        
+        if not os.path.exists(os.path.join(quantized_dir, "model_quantized.onnx")):
+            print(f"Exportando {model_id} para ONNX e quantizando em int8...")
+            model = ort.ORTModelForFeatureExtraction.from_pretrained(model_id, export=True)
+            quantizer = ort.ORTQuantizer.from_pretrained(model)
+            quantization_config = ort_configuration.AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=quantized_dir, quantization_config=quantization_config)
+            model.config.save_pretrained(quantized_dir)
+            transformers.AutoTokenizer.from_pretrained(model_id).save_pretrained(quantized_dir)
+        
+        self.model = ort.ORTModelForFeatureExtraction.from_pretrained(
+            quantized_dir, 
+            file_name="model_quantized.onnx"
+        )
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(quantized_dir)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Gera os embeddings com mean pooling sobre os tokens, como o sentence-transformers.
+        """
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True,
+                truncation=True,
+                return_tensors="np"
+            )
+            token_embeddings = self.model(**inputs).last_hidden_state
+            
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            
+            if self.normalize_embeddings:
+                embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+            batches.append(embeddings)
+            
+        return np.concatenate(batches) if batches else np.empty((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Gera os embeddings dos documentos.
+        """
+        return self._encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Gera o embedding de uma consulta.
+        """
+        return self._encode([text])[0].tolist()
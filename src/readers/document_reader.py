@@ -2,14 +2,30 @@
 Módulo para leitura e processamento de documentos PDF com OCR.
 """
 import os
-import glob
-from typing import List, Optional
+import gc
+import pickle
+import hashlib
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 
-# Importação principal da unstructured
-from unstructured.partition.pdf import partition_pdf
+import fitz
+from pypdf import PdfReader, PdfWriter
 
 from langchain_core.documents import Document
 
+# Cada processo com OCR "hi_res" carrega os modelos de layout e as imagens das
+# páginas, consumindo alguns GB de RAM; limita o paralelismo padrão
+DEFAULT_MAX_WORKERS = 4
+
+# Mínimo de caracteres extraíveis nas páginas amostradas para dispensar o OCR
+MIN_TEXT_LAYER_CHARS = 500
+
+# Versão da extração, incluída na chave do cache de documentos; incrementar quando
+# a escolha da estratégia ou o conteúdo extraído mudarem
+EXTRACTION_VERSION = 2
+
 
 class DocumentReader:
     """
@@ -17,14 +33,45 @@ class DocumentReader:
     incluindo OCR e extração de conteúdo estruturado.
     """
 
-    def __init__(self, documents_folder: str = "dados/"):
+    def __init__(self, 
+                 documents_folder: str = "dados/", 
+                 pages_per_batch: int = 10, 
+                 strategy: str = "auto",
+                 max_workers: Optional[int] = None,
+                 cache_dir: Optional[str] = ".cache/documents",
+                 chunking_strategy: Optional[str] = None):
         """
         Inicializa o leitor de documentos.
         
         Args:
             documents_folder: Caminho para a pasta onde estão os documentos.
+            pages_per_batch: Quantidade de páginas enviadas por vez ao OCR. Limita o número
+                de páginas convertidas em imagem simultaneamente na memória.
+            strategy: Estratégia de extração do unstructured.
+                - "auto": "fast" para PDFs com camada de texto e sem tabelas, "hi_res" para
+                  PDFs escaneados ou com tabelas
+                - "fast": Extrai o texto direto do PDF, sem OCR nem detecção de tabelas
+                - "hi_res": Análise de layout com OCR e estrutura de tabelas em HTML
+            max_workers: Quantidade máxima de PDFs processados em paralelo, cada um em um
+                processo. Padrão: min(núcleos de CPU, 4).
+            cache_dir: Pasta onde o conteúdo extraído de cada PDF é salvo, indexado pelo hash
+                do arquivo. PDFs inalterados não passam de novo pelo OCR. None desativa o cache.
+            chunking_strategy: Se "by_title", o unstructured já devolve os elementos agrupados
+                em chunks de até 4000 caracteres, respeitando títulos e tabelas; cada chunk vira
+                um documento marcado como pre_chunked e não é dividido de novo. Se None, cada
+                PDF vira um único documento.
         """
+        if strategy not in ("auto", "fast", "hi_res"):
+            raise ValueError(f"Estratégia não suportada: {strategy}")
+        if chunking_strategy not in (None, "by_title"):
+            raise ValueError(f"Estratégia de chunking não suportada: {chunking_strategy}")
+            
         self.documents_folder = documents_folder
+        self.pages_per_batch = pages_per_batch
+        self.strategy = strategy
+        self.max_workers = max_workers or min(os.cpu_count() or 1, DEFAULT_MAX_WORKERS)
+        self.cache_dir = cache_dir
+        self.chunking_strategy = chunking_strategy
 
     def get_pdf_files(self) -> List[str]:
         """
@@ -33,10 +80,141 @@ class DocumentReader:
         Returns:
             Lista de caminhos para os arquivos PDF encontrados.
         """
-        pdf_files = glob.glob(os.path.join(self.documents_folder, "*.pdf"))
+        # os.scandir reaproveita o tipo de arquivo lido junto com a listagem da pasta
+        with os.scandir(self.documents_folder) as entries:
+            pdf_files = [
+                entry.path for entry in entries
+                if entry.name.endswith(".pdf") and not entry.name.startswith(".") and entry.is_file()
+            ]
         return pdf_files
 
-    def process_pdf(self, file_path: str) -> Optional[Document]:
+    def detect_strategy(self, file_path: str, sample_pages: int = 3) -> str:
+        """
+        Define a estratégia de extração de um PDF.
+        
+        No modo "auto", PDFs nativamente digitais (com mais de MIN_TEXT_LAYER_CHARS
+        caracteres extraíveis nas primeiras páginas) usam "fast", que lê o texto
+        direto do arquivo em milissegundos por página. PDFs escaneados, ou com
+        tabelas nas páginas amostradas, passam pelo "hi_res", o único que
+        devolve a estrutura das tabelas em HTML.
+        
+        Args:
+            file_path: Caminho para o arquivo PDF.
+            sample_pages: Quantidade de páginas iniciais verificadas.
+            
+        Returns:
+            "fast" ou "hi_res".
+        """
+        if self.strategy != "auto":
+            return self.strategy
+        
+        text_chars = 0
+        with fitz.open(file_path) as pdf:
+            for page in pdf.pages(0, min(sample_pages, pdf.page_count)):
+                # O "fast" não estrutura tabelas; mantém o "hi_res" para não perdê-las
+                if page.find_tables().tables:
+                    return "hi_res"
+                text_chars += len(page.get_text().strip())
+        
+        if text_chars > MIN_TEXT_LAYER_CHARS:
+            return "fast"
+        return "hi_res"
+
+    def iter_page_batches(self, file_path: str) -> Iterator[Tuple[str, int]]:
+        """
+        Divide o PDF em arquivos temporários de até pages_per_batch páginas.
+        
+        Args:
+            file_path: Caminho para o arquivo PDF.
+            
+        Yields:
+            Tuplas (caminho do lote, número da primeira página do lote).
+        """
+        reader = PdfReader(file_path)
+        total_pages = len(reader.pages)
+        
+        if total_pages <= self.pages_per_batch:
+            yield file_path, 1
+            return
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for start in range(0, total_pages, self.pages_per_batch):
+                writer = PdfWriter()
+                for page in reader.pages[start:start + self.pages_per_batch]:
+                    writer.add_page(page)
+                
+                batch_path = os.path.join(temp_dir, f"paginas_{start + 1}.pdf")
+                writer.write(batch_path)
+                
+                yield batch_path, start + 1
+                os.remove(batch_path)
+
+    def get_cache_path(self, file_path: str) -> str:
+        """
+        Calcula o caminho do cache de um PDF a partir do hash BLAKE2b do seu conteúdo,
+        das estratégias de extração e de chunking configuradas e de EXTRACTION_VERSION.
+        
+        Args:
+            file_path: Caminho para o arquivo PDF.
+            
+        Returns:
+            Caminho do arquivo de cache.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        digest.update(f"{self.strategy}:{self.chunking_strategy}:{EXTRACTION_VERSION}".encode("utf-8"))
+        
+        return os.path.join(self.cache_dir, f"{digest.hexdigest()}.pkl")
+
+    def save_to_cache(self, cache_path: str, documents: List[Document]):
+        """
+        Salva o documento processado no cache de forma atômica: grava em um arquivo
+        temporário e o renomeia, para que uma interrupção não deixe um cache corrompido.
+        
+        Args:
+            cache_path: Caminho do arquivo de cache.
+            documents: Documentos extraídos do PDF.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(documents, f)
+            os.replace(temp_path, cache_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def load_from_cache(self, cache_path: str) -> Optional[List[Document]]:
+        """
+        Carrega os documentos salvos no cache.
+        
+        Uma entrada que não pode ser lida (arquivo corrompido ou pickle de uma versão
+        incompatível do Document) é removida, para que o PDF seja extraído de novo.
+        
+        Args:
+            cache_path: Caminho do arquivo de cache.
+            
+        Returns:
+            Documentos em cache, ou None se não houver uma entrada válida.
+        """
+        if not os.path.exists(cache_path):
+            return None
+        
+        try:
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+        except Exception as e:
+            print(f"    Cache inválido em {cache_path} ({e}); extraindo o PDF novamente.")
+            try:
+                os.remove(cache_path)
+            except OSError:
+                pass
+            return None
+
+    def process_pdf(self, file_path: str) -> Optional[List[Document]]:
         """
         Processa um arquivo PDF com OCR e extração de conteúdo estruturado.
         
@@ -44,59 +222,163 @@ class DocumentReader:
             file_path: Caminho para o arquivo PDF a ser processado.
             
         Returns:
-            Document: Documento processado ou None em caso de erro.
+            Documentos extraídos do PDF (um só, ou um por chunk com chunking_strategy),
+            ou None em caso de erro.
         """
-        print(f"  Analisando layout de: {os.path.basename(file_path)}...")
+        file_name = os.path.basename(file_path)
         
         try:
-            # Usa a estratégia "hi_res" para PDFs escaneados e pede para inferir a estrutura da tabela
-            elementos = partition_pdf(
-                filename=file_path,
-                strategy="hi_res",                # Estratégia de alta resolução para OCR
-                infer_table_structure=True,       # Pede para analisar e estruturar tabelas
-                languages=['por']                 # Define o idioma para o OCR
-            )
-            
-            conteudo_final = ""
-            for el in elementos:
-                # Se o elemento for uma tabela, pegamos sua representação em HTML
-                if "unstructured.documents.elements.Table" in str(type(el)):
-                    conteudo_final += "\n" + el.metadata.text_as_html + "\n"
-                # Para outros elementos (títulos, parágrafos), pegamos o texto simples
+            # Dentro do try para que um arquivo ilegível afete apenas este PDF
+            cache_path = self.get_cache_path(file_path) if self.cache_dir else None
+            documents = self.load_from_cache(cache_path) if cache_path else None
+            if documents is not None:
+                print(f"  Usando conteúdo em cache de: {file_name}")
+                for document in documents:
+                    document.metadata["source"] = file_path
+                return documents
+            
+            print(f"  Analisando layout de: {file_name}...")
+            
+            # Importada aqui para que o carregamento do índice em cache não pague
+            # o custo de importar a unstructured (e seus modelos de layout)
+            from unstructured.partition.pdf import partition_pdf
+            from unstructured.documents.elements import Table, TableChunk
+            
+            partes = []
+            documents = []
+            strategy = self.detect_strategy(file_path)
+            
+            chunking_kwargs = {}
+            if self.chunking_strategy == "by_title":
+                # Agrupa os elementos em chunks já durante a análise de layout
+                chunking_kwargs = {
+                    "chunking_strategy": "by_title",
+                    "max_characters": 4000,
+                    "new_after_n_chars": 3800,
+                    "combine_text_under_n_chars": 500,
+                }
+            
+            # Processa o PDF em lotes de páginas para que apenas as imagens
+            # de um lote fiquem na memória durante o OCR
+            if strategy == "hi_res":
+                page_batches = self.iter_page_batches(file_path)
+            else:
+                page_batches = [(file_path, 1)]
+            
+            for batch_path, first_page in page_batches:
+                # "hi_res" para PDFs escaneados, pedindo para inferir a estrutura da tabela;
+                # "fast" para PDFs com camada de texto
+                elementos = partition_pdf(
+                    filename=batch_path,
+                    strategy=strategy,                # Estratégia de extração
+                    infer_table_structure=True,       # Pede para analisar e estruturar tabelas
+                    languages=['por'],                # Define o idioma para o OCR
+                    starting_page_number=first_page,  # Mantém a numeração original das páginas
+                    **chunking_kwargs
+                )
+                
+                if self.chunking_strategy:
+                    for el in elementos:
+                        is_table = isinstance(el, (Table, TableChunk)) and el.metadata.text_as_html
+                        documents.append(Document(
+                            page_content=el.metadata.text_as_html if is_table else el.text,
+                            metadata={
+                                "source": file_path, 
+                                "page": el.metadata.page_number, 
+                                "pre_chunked": True
+                            }
+                        ))
                 else:
-                    conteudo_final += "\n" + el.text + "\n"
-                    
-            return Document(
-                page_content=conteudo_final,
-                metadata={"source": file_path}
-            )
+                    for el in elementos:
+                        # Se o elemento for uma tabela, pegamos sua representação em HTML
+                        if isinstance(el, Table):
+                            partes.append(el.metadata.text_as_html)
+                        # Para outros elementos (títulos, parágrafos), pegamos o texto simples
+                        else:
+                            partes.append(el.text)
+                
+                # Só o texto extraído é necessário; libera os elementos (e as imagens
+                # e tensores do modelo de layout que eles referenciam) antes do
+                # próximo lote, para não manter dois lotes na memória do processo
+                del elementos
+                gc.collect()
+            
+            if not self.chunking_strategy:
+                # Cada elemento fica entre quebras de linha; um único join evita copiar
+                # o texto acumulado a cada elemento
+                conteudo_final = "\n" + "\n\n".join(partes) + "\n" if partes else ""
+                
+                documents.append(Document(
+                    page_content=conteudo_final,
+                    metadata={"source": file_path}
+                ))
+            
+            if cache_path:
+                self.save_to_cache(cache_path, documents)
+                
+            return documents
 
         except Exception as e:
-            print(f"    Erro ao processar {os.path.basename(file_path)} com unstructured: {e}")
+            print(f"    Erro ao processar {file_name} com unstructured: {e}")
             return None
 
-    def process_all_documents(self) -> List[Document]:
+    def process_all_documents(self, pdf_files: Optional[List[str]] = None) -> List[Document]:
         """
         Processa todos os arquivos PDF encontrados na pasta de documentos.
         
+        Args:
+            pdf_files: Arquivos a serem processados. Se None, usa todos os PDFs da pasta.
+            
         Returns:
             Lista de documentos processados.
         """
-        pdf_files = self.get_pdf_files()
+        documents_per_file = self.process_documents(pdf_files)
+        valid_documents = [doc for docs in documents_per_file.values() for doc in docs]
+
+        if not valid_documents:
+            print("Não foi possível extrair conteúdo de nenhum dos arquivos PDF.")
+            
+        return valid_documents
+
+    def process_documents(self, pdf_files: Optional[List[str]] = None) -> Dict[str, List[Document]]:
+        """
+        Processa os arquivos PDF, informando o resultado de cada um.
+        
+        Os arquivos são processados em processos separados, sempre iniciados com
+        "spawn": com "fork", os filhos herdariam o CUDA já inicializado pelo modelo de
+        embeddings e falhariam ao usar a GPU no modelo de tabelas. Por isso o ponto de
+        entrada precisa estar protegido por if __name__ == "__main__".
+        
+        Args:
+            pdf_files: Arquivos a serem processados. Se None, usa todos os PDFs da pasta.
+            
+        Returns:
+            Dicionário caminho do arquivo -> documentos extraídos, apenas com os arquivos
+            processados com sucesso (os que falharam ficam de fora).
+        """
+        if pdf_files is None:
+            pdf_files = self.get_pdf_files()
         
         if not pdf_files:
             print(f"Nenhum arquivo PDF encontrado na pasta '{self.documents_folder}'.")
-            return []
+            return {}
 
         print(f"Encontrados {len(pdf_files)} arquivo(s) PDF. Iniciando análise de layout...")
         
-        # Processamos cada arquivo PDF
-        processed_docs = [self.process_pdf(file) for file in pdf_files]
+        # Processamos os arquivos PDF em paralelo: o OCR é limitado pela CPU,
+        # então cada arquivo roda em um processo separado
+        max_workers = min(self.max_workers, len(pdf_files))
+        if max_workers > 1:
+            with ProcessPoolExecutor(
+                max_workers=max_workers, 
+                mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                processed_docs = list(executor.map(self.process_pdf, pdf_files))
+        else:
+            processed_docs = [self.process_pdf(file) for file in pdf_files]
         
-        # Filtra qualquer resultado None em caso de erro no processamento
-        valid_documents = [doc for doc in processed_docs if doc is not None]
-
-        if not valid_documents:
-            print("Não foi possível extrair conteúdo de nenhum dos arquivos PDF.")
-            
-        return valid_documents
\ No newline at end of file
+        # process_pdf retorna None em caso de erro no processamento
+        return {
+            file: docs for file, docs in zip(pdf_files, processed_docs)
+            if docs is not None
+        }
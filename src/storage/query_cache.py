@@ -0,0 +1,127 @@
+"""
+Módulo para cache de respostas a consultas já realizadas.
+"""
+import json
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+
+class QueryCache:
+    """
+    Cache de respostas em dois níveis:
+    
+    1. Correspondência exata (LRU) sobre a consulta normalizada.
+    2. Correspondência semântica: a consulta é convertida em embedding e comparada,
+       por similaridade de cosseno, com as consultas anteriores.
+    
+    O cache é invalidado sempre que a configuração do retriever muda.
+    """
+
+    def __init__(self, embedding_model, max_size: int = 512, similarity_threshold: float = 0.95):
+        """
+        Inicializa o cache de consultas.
+        
+        Args:
+            embedding_model: Modelo de embedding usado para comparar as consultas.
+            max_size: Número máximo de respostas guardadas em cada nível.
+            similarity_threshold: Similaridade de cosseno mínima para reaproveitar uma resposta.
+        """
+        self.embedding_model = embedding_model
+        self.max_size = max_size
+        self.similarity_threshold = similarity_threshold
+        self.config_key = None
+        self.clear()
+
+    def clear(self):
+        """
+        Remove todas as respostas do cache.
+        """
+        self.exact_answers = OrderedDict()
+        self.semantic_index = None
+        self.semantic_answers: List[str] = []
+
+    def set_config(self, config: dict):
+        """
+        Define a configuração à qual as respostas guardadas pertencem.
+        Se for diferente da atual, o cache é esvaziado.
+        
+        Args:
+            config: Configuração do retriever.
+        """
+        config_key = json.dumps(config, sort_keys=True, default=str)
+        if config_key != self.config_key:
+            self.clear()
+            self.config_key = config_key
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """
+        Normaliza a consulta para a correspondência exata.
+        """
+        return " ".join(query.strip().lower().split())
+
+    def lookup(self, query: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Procura uma resposta para a consulta no cache.
+        
+        Args:
+            query: Consulta do usuário.
+            
+        Returns:
+            Tupla (resposta, embedding da consulta). A resposta é None se não houver
+            correspondência; o embedding é None em acertos exatos e deve ser repassado
+            para store em caso de falha, evitando calculá-lo novamente.
+        """
+        key = self.normalize_query(query)
+        if key in self.exact_answers:
+            self.exact_answers.move_to_end(key)
+            return self.exact_answers[key], None
+        
+        query_vector = np.asarray(
+            [self.embedding_model.get_embeddings_model().embed_query(query)], 
+            dtype=np.float32
+        )
+        faiss.normalize_L2(query_vector)
+        
+        if self.semantic_index is not None and self.semantic_index.ntotal > 0:
+            scores, ids = self.semantic_index.search(query_vector, 1)
+            if scores[0][0] >= self.similarity_threshold:
+                answer = self.semantic_answers[ids[0][0]]
+                self._store_exact(key, answer)
+                return answer, query_vector
+            
+        return None, query_vector
+
+    def store(self, query: str, answer: str, query_vector: np.ndarray):
+        """
+        Guarda a resposta de uma consulta nos dois níveis do cache.
+        
+        Args:
+            query: Consulta do usuário.
+            answer: Resposta gerada.
+            query_vector: Embedding normalizado da consulta, retornado por lookup.
+        """
+        self._store_exact(self.normalize_query(query), answer)
+        
+        if self.semantic_index is None:
+            self.semantic_index = faiss.IndexFlatIP(query_vector.shape[1])
+        
+        # Descarta a consulta mais antiga quando o limite é atingido
+        if self.semantic_index.ntotal >= self.max_size:
+            self.semantic_index.remove_ids(np.array([0], dtype=np.int64))
+            self.semantic_answers.pop(0)
+            
+        self.semantic_index.add(query_vector)
+        self.semantic_answers.append(answer)
+
+    def _store_exact(self, key: str, answer: str):
+        """
+        Guarda a resposta no cache exato, descartando a menos usada se necessário.
+        """
+        self.exact_answers[key] = answer
+        self.exact_answers.move_to_end(key)
+        if len(self.exact_answers) > self.max_size:
+            self.exact_answers.popitem(last=False)
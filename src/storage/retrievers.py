@@ -0,0 +1,69 @@
+"""
+Módulo com retrievers específicos da aplicação.
+"""
+from typing import Any, List, Optional
+
+import faiss
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores import FAISS
+
+
+class MMRRetriever(BaseRetriever):
+    """
+    Retriever de Maximum Marginal Relevance com a seleção vetorizada em NumPy.
+    
+    Os fetch_k candidatos vêm de uma única busca no índice FAISS e a similaridade
+    entre todos eles é calculada com um único produto de matrizes (fetch_k, d);
+    a seleção gulosa só faz operações elementares sobre essa matriz.
+    
+    Os vetores dos candidatos são reconstruídos a partir de reconstruction_index,
+    quando informado: uma cópia na CPU do índice que está na GPU, já que os
+    índices na GPU não implementam reconstruct_batch.
+    """
+
+    vector_store: FAISS
+    k: int = 4
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+    reconstruction_index: Optional[Any] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        """
+        Busca os k documentos que equilibram relevância para a consulta e diversidade.
+        """
+        query_vector = np.asarray([self.vector_store.embeddings.embed_query(query)], dtype=np.float32)
+        faiss.normalize_L2(query_vector)
+        
+        index = self.vector_store.index
+        _, ids = index.search(query_vector, self.fetch_k)
+        ids = ids[0][ids[0] >= 0]
+        if len(ids) == 0:
+            return []
+        
+        # Vetores dos candidatos (aproximados em índices quantizados, por isso renormalizados)
+        reconstruction_index = self.reconstruction_index if self.reconstruction_index is not None else index
+        candidates = reconstruction_index.reconstruct_batch(ids)
+        faiss.normalize_L2(candidates)
+        
+        relevance = candidates @ query_vector[0]
+        similarity = candidates @ candidates.T
+        
+        selected = [int(np.argmax(relevance))]
+        max_similarity = similarity[selected[0]].copy()
+        
+        while len(selected) < min(self.k, len(ids)):
+            scores = self.lambda_mult * relevance - (1 - self.lambda_mult) * max_similarity
+            scores[selected] = -np.inf
+            best = int(np.argmax(scores))
+            selected.append(best)
+            max_similarity = np.maximum(max_similarity, similarity[best])
+        
+        return [
+            self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[int(ids[i])])
+            for i in selected
+        ]
@@ -0,0 +1,123 @@
+"""
+Módulo com divisores de texto específicos da aplicação.
+"""
+import copy
+import importlib
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain.text_splitter import TextSplitter
+
+from src.models.embedding_model import resolve_huggingface_model_id
+
+
+class BatchedTokenTextSplitter(TextSplitter):
+    """
+    Divide textos em chunks de chunk_size tokens usando um tokenizador rápido
+    (implementado em Rust) do Hugging Face.
+    
+    Todos os documentos são tokenizados em uma única chamada em lote e os limites
+    de cada chunk são obtidos fatiando o offset_mapping com NumPy, sem percorrer
+    o texto caractere a caractere em Python.
+    """
+
+    def __init__(self, 
+                 model_name: str, 
+                 chunk_size: Optional[int] = None, 
+                 chunk_overlap: int = 32, 
+                 max_seq_length: Optional[int] = None,
+                 **kwargs):
+        """
+        Inicializa o divisor.
+        
+        Args:
+            model_name: Modelo do Hugging Face cujo tokenizador será usado.
+            chunk_size: Quantidade máxima de tokens por chunk. Padrão: o limite do modelo
+                (max_seq_length menos os tokens especiais), ou 256 se não informado.
+            chunk_overlap: Quantidade de tokens repetidos entre chunks consecutivos;
+                precisa ser menor que chunk_size.
+            max_seq_length: Quantidade máxima de tokens que o modelo de embeddings
+                processa por texto. Chunks maiores seriam truncados ao gerar os
+                embeddings, então chunk_size é limitado a esse valor.
+        """
+        try:
+            transformers = importlib.import_module("transformers")
+        except ImportError:
+            raise ImportError(
+                "O pacote 'transformers' não está instalado. "
+                "Instale com: pip install transformers"
+            )
+        
+        self.tokenizer = transformers.AutoTokenizer.from_pretrained(
+            resolve_huggingface_model_id(model_name), 
+            use_fast=True
+        )
+        
+        # Os chunks são tokenizados sem [CLS]/[SEP], que o modelo acrescenta ao gerar o embedding
+        max_tokens = max_seq_length - self.tokenizer.num_special_tokens_to_add() if max_seq_length else None
+        if chunk_size is None:
+            chunk_size = max_tokens or 256
+        elif max_tokens and chunk_size > max_tokens:
+            print(f"AVISO: chunk_size={chunk_size} excede o limite do modelo; usando {max_tokens} tokens.")
+            chunk_size = max_tokens
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) precisa ser menor que chunk_size ({chunk_size})")
+        
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+
+    def split_texts(self, texts: List[str]) -> List[List[str]]:
+        """
+        Divide vários textos de uma vez.
+        
+        Args:
+            texts: Textos a serem divididos.
+            
+        Returns:
+            Lista com os chunks de cada texto, na mesma ordem.
+        """
+        encoded = self.tokenizer(
+            texts,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            verbose=False
+        )
+        
+        step = self._chunk_size - self._chunk_overlap
+        results = []
+        for text, offsets in zip(texts, encoded["offset_mapping"]):
+            offsets = np.asarray(offsets, dtype=np.int64)
+            n_tokens = len(offsets)
+            if n_tokens == 0:
+                results.append([])
+                continue
+            
+            # Janelas de chunk_size tokens a cada step tokens, até a que alcança o fim do texto
+            starts = np.arange(0, n_tokens, step)
+            starts = starts[:np.searchsorted(starts + self._chunk_size, n_tokens) + 1]
+            ends = np.minimum(starts + self._chunk_size, n_tokens) - 1
+            
+            char_starts = offsets[starts, 0]
+            char_ends = offsets[ends, 1]
+            results.append([text[start:end] for start, end in zip(char_starts, char_ends)])
+            
+        return results
+
+    def split_text(self, text: str) -> List[str]:
+        """
+        Divide um texto em chunks de tokens.
+        """
+        return self.split_texts([text])[0]
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """
+        Divide os documentos tokenizando todos em um único lote.
+        """
+        chunks_per_document = self.split_texts([doc.page_content for doc in documents])
+        
+        return [
+            Document(page_content=chunk, metadata=copy.deepcopy(doc.metadata))
+            for doc, chunks in zip(documents, chunks_per_document)
+            for chunk in chunks
+        ]
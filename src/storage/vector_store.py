@@ -1,58 +1,532 @@
 """
 Módulo para gerenciar armazenamento de vetores.
 """
-from typing import List
+import os
+import math
+import uuid
+import hashlib
+from typing import List, Optional
+
+import faiss
+import numpy as np
 from langchain_core.documents import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+from src.storage.text_splitters import BatchedTokenTextSplitter
+from src.storage.retrievers import MMRRetriever
+
+# Abaixo deste número de vetores a busca exaustiva (sq8) é rápida o suficiente
+IVFPQ_MIN_VECTORS = 10000
+
+
+def cosine_relevance_score(similarity: float) -> float:
+    """
+    Converte o produto interno entre vetores normalizados (similaridade de cosseno)
+    em uma pontuação de relevância entre 0 e 1.
+    """
+    return min(1.0, max(0.0, similarity))
+
+
+# Quantizações aceitas pelo índice "hnsw_sq"
+SQ_TYPES = {
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+    "8bit": faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+# Os vetores são normalizados na inserção (create_vector_store) e nas consultas
+# (BatchedEmbeddings.embed_query), então o produto interno equivale à similaridade
+# de cosseno, com metade das operações da distância L2. O normalize_L2 da LangChain
+# não se aplica a MAX_INNER_PRODUCT e fica desligado
+FAISS_OPTIONS = {
+    "distance_strategy": DistanceStrategy.MAX_INNER_PRODUCT,
+    "relevance_score_fn": cosine_relevance_score,
+}
+
 
 class VectorStore:
     """
     Classe responsável por gerenciar o armazenamento de vetores dos documentos.
     """
 
-    def __init__(self, embedding_model):
+    def __init__(self, 
+                 embedding_model, 
+                 chunk_size: int = None, 
+                 chunk_overlap: int = None,
+                 splitter: str = "recursive",
+                 index_type: str = "auto",
+                 sq_type: str = "fp16",
+                 use_gpu: bool = False):
         """
         Inicializa o armazenamento de vetores.
         
         Args:
             embedding_model: Modelo de embedding a ser usado para gerar os vetores.
+            chunk_size: Tamanho máximo de cada chunk, em caracteres para "recursive" (padrão 4000)
+                ou em tokens para "tokens" (padrão e limite: o tamanho máximo de entrada do modelo).
+            chunk_overlap: Sobreposição entre chunks consecutivos, na mesma unidade de chunk_size
+                (padrão 200 caracteres ou 32 tokens).
+            splitter: Estratégia de divisão dos documentos.
+                - "recursive": Divisão por separadores HTML/texto, em caracteres
+                - "tokens": Divisão em tokens com o tokenizador do próprio modelo de embeddings,
+                  em lote (apenas para os provedores "huggingface" e "local")
+            index_type: Tipo de índice FAISS a ser criado.
+                - "auto": "sq8" para menos de 10 mil vetores, "ivfpq" a partir disso
+                - "flat": Busca exaustiva, exata, O(N) por consulta
+                - "sq8": Busca exaustiva com vetores quantizados em int8 (4x menos memória)
+                - "hnsw": Grafo HNSW, busca aproximada em ~O(log N) sem treino
+                - "hnsw_sq": Grafo HNSW com vetores quantizados conforme sq_type
+                - "ivfpq": Inverted File + Product Quantization, busca sublinear e vetores comprimidos
+            sq_type: Quantização dos vetores no "hnsw_sq": "fp16" (metade da memória) ou
+                "8bit" (um quarto da memória, com maior perda de recall).
+            use_gpu: Se True, move o índice para a GPU (requer faiss-gpu). Com mais de uma
+                GPU, o índice é dividido entre todas elas. O FAISS não copia índices SQ8 nem
+                HNSW para a GPU: "auto" e "sq8" passam a usar "flat" abaixo de 10 mil vetores,
+                e "hnsw"/"hnsw_sq" não são aceitos.
         """
+        if index_type not in ("auto", "flat", "sq8", "hnsw", "hnsw_sq", "ivfpq"):
+            raise ValueError(f"Tipo de índice não suportado: {index_type}")
+        if sq_type not in SQ_TYPES:
+            raise ValueError(f"Tipo de quantização não suportado: {sq_type}")
+        if splitter not in ("recursive", "tokens"):
+            raise ValueError(f"Divisor de texto não suportado: {splitter}")
+        if use_gpu and index_type in ("hnsw", "hnsw_sq"):
+            raise ValueError(
+                f"O índice \"{index_type}\" não pode ser movido para a GPU; "
+                "use \"flat\", \"ivfpq\" ou \"auto\" com use_gpu"
+            )
+            
         self.embedding_model = embedding_model
+        self.index_type = index_type
+        self.sq_type = sq_type
+        self.use_gpu = use_gpu
+        self.gpu_resources = None
+        self.index_on_gpu = False
+        self.cpu_index = None
         self.vector_store = None
-        self.text_splitter = RecursiveCharacterTextSplitter.from_language(
-            language="html",
-            chunk_size=4000, 
-            chunk_overlap=200
-        )
+        self.splitter = splitter
+        
+        if splitter == "tokens":
+            if embedding_model.provider not in ("huggingface", "local"):
+                raise ValueError("O divisor \"tokens\" só está disponível para os provedores huggingface e local")
+            
+            self.text_splitter = BatchedTokenTextSplitter(
+                model_name=embedding_model.model_name,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap if chunk_overlap is not None else 32,
+                max_seq_length=embedding_model.get_max_seq_length()
+            )
+            # O divisor limita o chunk_size ao tamanho máximo de entrada do modelo
+            self.chunk_size = self.text_splitter._chunk_size
+            self.chunk_overlap = self.text_splitter._chunk_overlap
+        else:
+            self.chunk_size = chunk_size or 4000
+            self.chunk_overlap = chunk_overlap if chunk_overlap is not None else 200
+            self.text_splitter = RecursiveCharacterTextSplitter.from_language(
+                language="html",
+                chunk_size=self.chunk_size, 
+                chunk_overlap=self.chunk_overlap
+            )
+            # Documentos sem tabelas HTML não precisam passar pelos separadores de tags
+            self.plain_text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                separators=["\n\n", "\n", " ", ""]
+            )
 
     def create_chunks(self, documents: List[Document]) -> List[Document]:
         """
         Divide os documentos em pedaços menores (chunks).
         
+        No divisor "recursive", apenas documentos com tabelas em HTML usam os
+        separadores de tags; os demais usam os separadores de texto simples.
+        Documentos já divididos na leitura (metadata "pre_chunked") só são
+        divididos de novo se ultrapassarem chunk_size.
+        
         Args:
             documents: Lista de documentos a serem divididos.
             
         Returns:
             Lista de documentos divididos em chunks.
         """
-        return self.text_splitter.split_documents(documents)
+        if self.splitter == "tokens":
+            return self.text_splitter.split_documents(documents)
+        
+        chunks = []
+        for doc in documents:
+            if doc.metadata.get("pre_chunked") and len(doc.page_content) <= self.chunk_size:
+                chunks.append(doc)
+                continue
+            
+            splitter = self.text_splitter if "<table" in doc.page_content else self.plain_text_splitter
+            chunks.extend(splitter.split_documents([doc]))
+            
+        return chunks
+
+    @staticmethod
+    def chunk_digest(text: str) -> bytes:
+        """
+        Calcula a assinatura usada para identificar chunks repetidos.
+        
+        Dois chunks são considerados iguais se o texto coincide após normalizar
+        os espaços em branco.
+        """
+        normalized = " ".join(text.split())
+        return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest()
+
+    @staticmethod
+    def deduplicate_chunks(chunks: List[Document], seen: Optional[set] = None) -> List[Document]:
+        """
+        Remove chunks repetidos (cabeçalhos, rodapés e páginas idênticas do OCR)
+        antes de gerar os embeddings, mantendo a primeira ocorrência.
+        
+        Args:
+            chunks: Chunks a serem filtrados.
+            seen: Assinaturas (chunk_digest) de chunks já armazenados, que também
+                são descartados.
+            
+        Returns:
+            Chunks sem repetição, na ordem original.
+        """
+        seen = set(seen) if seen else set()
+        unique_chunks = []
+        for chunk in chunks:
+            digest = VectorStore.chunk_digest(chunk.page_content)
+            if digest not in seen:
+                seen.add(digest)
+                unique_chunks.append(chunk)
+                
+        return unique_chunks
 
-    def create_vector_store(self, documents: List[Document]):
+    def create_vector_store(self, 
+                            documents: List[Document],
+                            nlist: Optional[int] = None,
+                            m: Optional[int] = None,
+                            nbits: int = 8,
+                            nprobe: Optional[int] = None):
         """
         Cria o armazenamento de vetores a partir dos documentos.
         
         Args:
             documents: Lista de documentos a serem armazenados.
+            nlist, m, nbits, nprobe: Parâmetros do índice IVFPQ (ver build_index).
         """
         chunks = self.create_chunks(documents)
         print(f"Documentos processados e divididos em {len(chunks)} chunks.")
         
-        self.vector_store = FAISS.from_documents(
-            chunks, 
-            embedding=self.embedding_model.get_embeddings_model()
+        chunks = self.deduplicate_chunks(chunks)
+        print(f"{len(chunks)} chunks únicos após remover duplicados.")
+        
+        vectors = self.embed_chunks(chunks)
+        
+        index = self.build_index(vectors, nlist=nlist, m=m, nbits=nbits, nprobe=nprobe)
+        
+        # A matriz vai direto para o add do FAISS, sem conversões linha a linha
+        index.add(vectors)
+        
+        ids, docstore_entries = self.create_docstore_entries(chunks)
+        
+        self.vector_store = FAISS(
+            embedding_function=self.embedding_model.get_embeddings_model(),
+            index=index,
+            docstore=InMemoryDocstore(docstore_entries),
+            index_to_docstore_id=dict(enumerate(ids)),
+            **FAISS_OPTIONS
+        )
+        
+        # Permite reconstruir vetores pelo id (necessário para a busca MMR)
+        if isinstance(index, faiss.IndexIVF):
+            index.make_direct_map()
+        
+    def add_documents(self, documents: List[Document]) -> int:
+        """
+        Adiciona novos documentos ao armazenamento existente, sem reconstruí-lo.
+        
+        Apenas os chunks novos são embedados e inseridos no índice: no HNSW eles
+        são ligados ao grafo já construído e no IVFPQ são atribuídos aos
+        centróides já treinados. Chunks iguais a algum já armazenado são ignorados.
+        
+        Args:
+            documents: Documentos a serem adicionados.
+            
+        Returns:
+            Quantidade de chunks adicionados.
+        """
+        if not self.vector_store:
+            raise ValueError("O vector store ainda não foi criado. Chame create_vector_store primeiro.")
+        
+        docstore = self.vector_store.docstore
+        index_to_docstore_id = self.vector_store.index_to_docstore_id
+        stored_digests = {
+            self.chunk_digest(docstore.search(doc_id).page_content)
+            for doc_id in index_to_docstore_id.values()
+        }
+        
+        chunks = self.deduplicate_chunks(self.create_chunks(documents), seen=stored_digests)
+        if not chunks:
+            print("Nenhum chunk novo para adicionar.")
+            return 0
+        
+        vectors = self.embed_chunks(chunks)
+        
+        if self.index_on_gpu:
+            # Índices divididos entre GPUs (IndexShards) só aceitam um add; os vetores
+            # vão para a cópia na CPU, que é copiada de novo para a(s) GPU(s)
+            offset = self.cpu_index.ntotal
+            self.cpu_index.add(vectors)
+            self.vector_store.index = self.cpu_index
+            self.index_on_gpu = False
+            self.gpu_resources = None
+            self.move_index_to_gpu()
+        else:
+            offset = self.vector_store.index.ntotal
+            self.vector_store.index.add(vectors)
+        
+        ids, docstore_entries = self.create_docstore_entries(chunks)
+        docstore.add(docstore_entries)
+        index_to_docstore_id.update({offset + i: doc_id for i, doc_id in enumerate(ids)})
+        
+        print(f"{len(chunks)} chunks adicionados ao vector store.")
+        return len(chunks)
+
+    def embed_chunks(self, chunks: List[Document]) -> np.ndarray:
+        """
+        Calcula os embeddings normalizados dos chunks.
+        
+        Todos os embeddings são calculados de uma vez, passando pelos lotes
+        paralelos do BatchedEmbeddings, e convertidos em uma única matriz float32.
+        
+        Args:
+            chunks: Chunks a serem embedados.
+            
+        Returns:
+            Matriz (N, d) de embeddings com norma L2 unitária.
+        """
+        embeddings = self.embedding_model.get_embeddings_model()
+        texts = [chunk.page_content for chunk in chunks]
+        vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        
+        return vectors
+
+    @staticmethod
+    def create_docstore_entries(chunks: List[Document]):
+        """
+        Gera um id para cada chunk e os documentos correspondentes do docstore.
+        
+        Args:
+            chunks: Chunks na ordem em que foram inseridos no índice.
+            
+        Returns:
+            Tupla (ids, entradas), com os ids na ordem dos chunks e o dicionário
+            id -> Document para o InMemoryDocstore.
+        """
+        ids = [str(uuid.uuid4()) for _ in chunks]
+        entries = {
+            doc_id: Document(id=doc_id, page_content=chunk.page_content, metadata=chunk.metadata)
+            for doc_id, chunk in zip(ids, chunks)
+        }
+        
+        return ids, entries
+
+    def build_index(self, 
+                    vectors: np.ndarray,
+                    nlist: Optional[int] = None,
+                    m: Optional[int] = None,
+                    nbits: int = 8,
+                    nprobe: Optional[int] = None) -> faiss.Index:
+        """
+        Cria e treina (quando necessário) o índice FAISS para os vetores informados.
+        
+        Com SQ8, cada dimensão é guardada em 1 byte em vez de 4, e a distância é
+        calculada pelos kernels SIMD de int8 do FAISS. Com HNSW, a consulta percorre
+        um grafo de vizinhança em ~O(log N) passos. Com IVFPQ, cada consulta
+        compara o vetor com nlist centróides e com os vetores de nprobe listas, em
+        vez de todos os N vetores, e cada vetor é guardado em m bytes em vez de 4·d bytes.
+        
+        Args:
+            vectors: Matriz (N, d) de embeddings normalizados em float32.
+            nlist: Número de listas (centróides) do IVFPQ. Padrão: max(2·sqrt(N), 20).
+            m: Número de subvetores do PQ; precisa dividir d. Padrão: d // 8.
+            nbits: Bits por código de subvetor do PQ.
+            nprobe: Listas visitadas por consulta no IVFPQ. Padrão: min(nlist // 4, 10).
+            
+        Returns:
+            Índice FAISS vazio e pronto para receber os vetores.
+        """
+        n, d = vectors.shape
+        
+        index_type = self.index_type
+        if index_type == "auto":
+            index_type = "ivfpq" if n >= IVFPQ_MIN_VECTORS else "sq8"
+        
+        # O IndexScalarQuantizer não tem versão na GPU; a busca exaustiva em fp32
+        # na GPU já é uma única multiplicação de matrizes
+        if index_type == "sq8" and self.use_gpu:
+            index_type = "flat"
+        
+        # O PQ precisa de ao menos 2^nbits vetores de treino
+        if index_type == "ivfpq" and n < 2 ** nbits:
+            print(f"Apenas {n} vetores: usando índice flat em vez de IVFPQ.")
+            index_type = "flat"
+            
+        if index_type == "flat":
+            return faiss.IndexFlatIP(d)
+        
+        if index_type == "sq8":
+            # O treino apenas calcula o intervalo de cada dimensão para a quantização
+            index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+            index.train(vectors)
+            return index
+        
+        if index_type == "hnsw":
+            # M=32 vizinhos por nó; efConstruction/efSearch maiores aumentam o recall e o custo
+            index = faiss.IndexHNSWFlat(d, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 100
+            index.hnsw.efSearch = 64
+            return index
+        
+        if index_type == "hnsw_sq":
+            # Mesmo grafo do "hnsw", com os vetores guardados em fp16 ou int8
+            index = faiss.IndexHNSWSQ(d, SQ_TYPES[self.sq_type], 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 100
+            index.hnsw.efSearch = 64
+            index.train(vectors)
+            return index
+        
+        nlist = nlist or max(int(2 * math.sqrt(n)), 20)
+        if m is None:
+            m = next(m for m in range(max(d // 8, 1), 0, -1) if d % m == 0)
+        elif d % m != 0:
+            raise ValueError(f"m={m} precisa dividir a dimensão dos vetores ({d})")
+        
+        quantizer = faiss.IndexFlatIP(d)
+        index = faiss.IndexIVFPQ(quantizer, d, nlist, m, nbits, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.nprobe = nprobe or max(min(nlist // 4, 10), 1)
+        
+        return index
+        
+    def get_cache_signature(self, index_params: Optional[dict] = None) -> dict:
+        """
+        Retorna os parâmetros que mudam o conteúdo do índice, usados na chave do
+        índice em cache.
+        
+        Args:
+            index_params: Parâmetros do IVFPQ passados para create_vector_store.
+            
+        Returns:
+            Divisor, tamanho dos chunks, tipo de índice e os parâmetros que se aplicam a ele.
+        """
+        signature = {
+            "splitter": self.splitter,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "index_type": self.index_type,
+            "distance_strategy": FAISS_OPTIONS["distance_strategy"],
+        }
+        
+        # Com use_gpu, "sq8" (e o "auto" para bases pequenas) vira "flat" (ver build_index)
+        if self.index_type in ("auto", "sq8"):
+            signature["use_gpu"] = self.use_gpu
+        if self.index_type == "hnsw_sq":
+            signature["sq_type"] = self.sq_type
+        if self.index_type in ("auto", "ivfpq"):
+            signature["index_params"] = index_params or {}
+            
+        return signature
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        """
+        Verifica se há um armazenamento de vetores salvo no caminho.
+        
+        Args:
+            path: Pasta onde o armazenamento foi salvo.
+        """
+        return os.path.exists(os.path.join(path, "index.faiss")) and os.path.exists(os.path.join(path, "index.pkl"))
+
+    def save(self, path: str):
+        """
+        Salva o índice FAISS (faiss.write_index) e o docstore em disco.
+        
+        Args:
+            path: Pasta onde o armazenamento será salvo.
+        """
+        if not self.vector_store:
+            raise ValueError("O vector store ainda não foi criado. Chame create_vector_store primeiro.")
+        
+        index = self.vector_store.index
+        if self.index_on_gpu:
+            # Índices na GPU não podem ser serializados; salva a cópia mantida na CPU
+            self.vector_store.index = self.cpu_index
+            
+        try:
+            self.vector_store.save_local(path)
+        finally:
+            self.vector_store.index = index
+
+    def load(self, path: str):
+        """
+        Carrega um armazenamento de vetores salvo com save.
+        
+        Args:
+            path: Pasta onde o armazenamento foi salvo.
+        """
+        # O arquivo index.pkl é gerado pela própria aplicação, então é seguro desserializá-lo
+        self.vector_store = FAISS.load_local(
+            path,
+            self.embedding_model.get_embeddings_model(),
+            allow_dangerous_deserialization=True,
+            **FAISS_OPTIONS
         )
+        self.gpu_resources = None
+        self.index_on_gpu = False
+        self.cpu_index = None
+
+    def move_index_to_gpu(self):
+        """
+        Move o índice FAISS para a GPU, mantendo a CPU como alternativa se
+        o FAISS não tiver suporte a GPU ou se não houver GPU disponível.
+        
+        Com uma GPU, usa index_cpu_to_gpu; com várias, index_cpu_to_all_gpus com
+        os vetores divididos (shards) entre elas, para índices que não cabem em uma só.
+        
+        O índice original continua na CPU (cpu_index): os índices na GPU, e em especial
+        os divididos entre GPUs, não implementam reconstruct_batch, usado pelo MMR.
+        """
+        if not self.vector_store:
+            raise ValueError("O vector store ainda não foi criado. Chame create_vector_store primeiro.")
+        
+        if not hasattr(faiss, "StandardGpuResources") or faiss.get_num_gpus() == 0:
+            print("AVISO: FAISS com suporte a GPU não disponível, mantendo o índice na CPU.")
+            return
+        
+        if self.index_on_gpu:
+            return
+        
+        num_gpus = faiss.get_num_gpus()
+        cpu_index = self.vector_store.index
+        
+        try:
+            if num_gpus > 1:
+                options = faiss.GpuMultipleClonerOptions()
+                options.shard = True
+                self.vector_store.index = faiss.index_cpu_to_all_gpus(cpu_index, co=options)
+            else:
+                # Os recursos precisam viver enquanto o índice na GPU estiver em uso
+                self.gpu_resources = faiss.StandardGpuResources()
+                self.vector_store.index = faiss.index_cpu_to_gpu(self.gpu_resources, 0, cpu_index)
+            
+            self.cpu_index = cpu_index
+            self.index_on_gpu = True
+            print(f"Índice FAISS movido para {num_gpus} GPU(s).")
+        except RuntimeError as e:
+            self.gpu_resources = None
+            print(f"AVISO: Não foi possível mover o índice para a GPU, mantendo na CPU: {e}")
         
     def get_retriever(self, 
                    search_type: str = "similarity", 
@@ -60,7 +534,8 @@ class VectorStore:
                    score_threshold: float = None,
                    fetch_k: int = None,
                    lambda_mult: float = 0.5,
-                   filter: dict = None):
+                   filter: dict = None,
+                   ef_search: int = None):
         """
         Cria um retriever para buscar documentos similares.
         
@@ -76,6 +551,13 @@ class VectorStore:
                 - 0.0: Diversidade máxima
                 - 1.0: Relevância máxima
             filter: Dicionário para filtrar documentos por metadados.
+            ef_search: Tamanho da lista de candidatos na busca dos índices HNSW ("hnsw" e "hnsw_sq").
+                A latência cresce aproximadamente de forma linear com ef_search, e o recall sobe
+                rapidamente até se estabilizar:
+                - 16: Menor latência, recall mais baixo (tráfego alto)
+                - 64: Padrão, bom equilíbrio
+                - 128 ou mais: Recall próximo da busca exata (avaliações offline)
+                Deve ser maior ou igual a k (ou fetch_k no MMR). Ignorado para outros índices.
             
         Returns:
             Retriever para buscar documentos similares.
@@ -83,6 +565,19 @@ class VectorStore:
         if not self.vector_store:
             raise ValueError("O vector store ainda não foi criado. Chame create_vector_store primeiro.")
         
+        if ef_search is not None and isinstance(self.vector_store.index, faiss.IndexHNSW):
+            self.vector_store.index.hnsw.efSearch = ef_search
+        
+        # MMR sem filtro usa a seleção vetorizada; com filtro, a implementação da LangChain
+        if search_type == "mmr" and filter is None:
+            return MMRRetriever(
+                vector_store=self.vector_store,
+                k=k,
+                fetch_k=fetch_k if fetch_k is not None else 20,
+                lambda_mult=lambda_mult,
+                reconstruction_index=self.cpu_index if self.index_on_gpu else None
+            )
+        
         # Configura os parâmetros de busca
         search_kwargs = {"k": k}
         